@@ -0,0 +1,37 @@
+import pytest
+import torch
+
+from text_generation_server.models.flash_causal_lm import FlashCausalLM
+from text_generation_server.utils.tokens import NextTokenChooser
+
+
+@pytest.fixture
+def random_logits():
+    generator = torch.Generator().manual_seed(0)
+    return torch.randn(4, 32, generator=generator)
+
+
+@pytest.fixture
+def fake_flash_causal_lm(random_logits):
+    # No weights needed: `forward_greedy` only reduces the logits of `forward`
+    model = FlashCausalLM.__new__(FlashCausalLM)
+    model.forward = lambda *args, **kwargs: (random_logits.clone(), None)
+    return model
+
+
+def test_forward_greedy(fake_flash_causal_lm, random_logits):
+    next_token_ids, next_token_logprobs, present = fake_flash_causal_lm.forward_greedy(
+        None, None, None, 1
+    )
+
+    assert present is None
+    assert next_token_ids.shape == (random_logits.shape[0],)
+    assert next_token_logprobs.shape == (random_logits.shape[0],)
+
+    next_token_chooser = NextTokenChooser()
+    assert next_token_chooser.greedy
+    for i in range(random_logits.shape[0]):
+        next_id, logprobs = next_token_chooser(None, random_logits[i : i + 1].clone())
+
+        assert next_token_ids[i] == next_id.squeeze()
+        assert torch.allclose(next_token_logprobs[i], logprobs[0, next_id.squeeze()])
@@ -0,0 +1,22 @@
+import pytest
+import torch
+
+from text_generation_server.utils.dist import unshard_logits
+
+
+def gathered_logits(world_size, tokens, vocab_shard):
+    # all_gather_into_tensor layout: shards of [tokens, vocab_shard] stacked by rank
+    shards = [torch.randn(tokens, vocab_shard) for _ in range(world_size)]
+    return shards, torch.cat(shards, dim=0)
+
+
+@pytest.mark.parametrize("world_size", [1, 2, 4])
+def test_unshard_logits(world_size):
+    shards, gathered = gathered_logits(world_size, tokens=3, vocab_shard=5)
+
+    logits = unshard_logits(gathered, world_size)
+
+    assert logits.shape == (3, world_size * 5)
+    # Vocabulary shards are concatenated in rank order for every token
+    for rank, shard in enumerate(shards):
+        assert torch.equal(logits[:, rank * 5 : (rank + 1) * 5], shard)
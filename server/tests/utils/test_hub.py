@@ -1,6 +1,7 @@
 import pytest
 
 from text_generation_server.utils.hub import (
+    load_config,
     weight_hub_files,
     download_weights,
     weight_files,
@@ -38,3 +39,11 @@ def test_weight_files_error():
         weight_files("bigscience/bloom-560m", revision="error")
     with pytest.raises(LocalEntryNotFoundError):
         weight_files("bert-base-uncased")
+
+
+def test_load_config_copy():
+    config = load_config("bigscience/bloom-560m")
+    vocab_size = config.vocab_size
+    config.vocab_size += 1
+
+    assert load_config("bigscience/bloom-560m").vocab_size == vocab_size
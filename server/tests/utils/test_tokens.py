@@ -2,6 +2,7 @@ from text_generation_server.utils.tokens import (
     StopSequenceCriteria,
     StoppingCriteria,
     FinishReason,
+    NextTokenChooser,
 )
 
 
@@ -33,3 +34,10 @@ def test_stopping_criteria_max():
     assert criteria(1, "") == (False, None)
     assert criteria(1, "") == (False, None)
     assert criteria(1, "") == (True, FinishReason.FINISH_REASON_LENGTH)
+
+
+def test_next_token_chooser_greedy():
+    assert NextTokenChooser().greedy
+    assert not NextTokenChooser(do_sample=True).greedy
+    assert not NextTokenChooser(temperature=0.5).greedy
+    assert not NextTokenChooser(repetition_penalty=1.2).greedy
@@ -0,0 +1,91 @@
+import pytest
+import torch
+
+from safetensors.torch import save_file
+
+from text_generation_server.utils.weights import (
+    ShardAxis,
+    SAFETENSORS_DTYPES,
+    load_file,
+    read_header,
+    sharded_shape,
+)
+
+
+def test_read_header(tmp_path):
+    tensors = {
+        "a.weight": torch.zeros(4, 6, dtype=torch.float16),
+        "a.bias": torch.zeros(4, dtype=torch.float32),
+        "b.ids": torch.zeros(2, 3, 5, dtype=torch.int64),
+    }
+    file = tmp_path / "model.safetensors"
+    save_file(tensors, str(file), metadata={"format": "pt"})
+
+    header = read_header(str(file))
+
+    assert set(header) == set(tensors)
+    end = 0
+    for name in sorted(header, key=lambda name: header[name]["data_offsets"][0]):
+        tensor = tensors[name]
+        assert SAFETENSORS_DTYPES[header[name]["dtype"]] == tensor.dtype
+        assert header[name]["shape"] == list(tensor.shape)
+
+        start, stop = header[name]["data_offsets"]
+        assert start == end
+        assert stop - start == tensor.numel() * tensor.element_size()
+        end = stop
+
+
+@pytest.mark.parametrize(
+    "axis,expected",
+    [
+        (ShardAxis.COLUMN, [2, 6]),
+        (ShardAxis.ROW, [4, 3]),
+        (ShardAxis.EMBEDDING, [2, 6]),
+        (ShardAxis.REPLICATE, [4, 6]),
+        (ShardAxis.ZERO_IF_NONZERO_RANK, [4, 6]),
+    ],
+)
+def test_sharded_shape(axis, expected):
+    shape = [4, 6]
+    assert sharded_shape(shape, axis, world_size=2) == expected
+    # The checkpoint shape is left untouched
+    assert shape == [4, 6]
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires CUDA")
+def test_load_file_standalone(tmp_path):
+    tensors = {
+        "linear.weight": torch.randn(256, 256),
+        "linear.bias": torch.randn(256),
+    }
+    file = tmp_path / "model.safetensors"
+    save_file(tensors, str(file), metadata={"format": "pt"})
+
+    model = torch.nn.Module()
+    model.linear = torch.nn.Linear(256, 256)
+    device = torch.device("cuda")
+    load_file(
+        dict(model.named_modules()),
+        dict(model.named_parameters()),
+        {},
+        {"linear.weight"},
+        str(file),
+        device=device,
+        target_dtype=torch.float32,
+        rank=0,
+        world_size=1,
+    )
+    torch.cuda.synchronize(device)
+
+    assert torch.equal(model.linear.weight.cpu(), tensors["linear.weight"])
+    assert torch.equal(model.linear.bias.cpu(), tensors["linear.bias"])
+    # The standalone weight owns its allocation, the bias is a view of the flat buffer
+    assert model.linear.weight.untyped_storage().nbytes() == 256 * 256 * 4
+    assert model.linear.bias.untyped_storage().nbytes() >= 256 * 4
+
+    # Replacing the standalone weight (like `post_load_weights`) frees the old one
+    allocated = torch.cuda.memory_allocated(device)
+    model.linear.weight = torch.nn.Parameter(model.linear.weight.t().contiguous())
+    torch.cuda.empty_cache()
+    assert torch.cuda.memory_allocated(device) == allocated
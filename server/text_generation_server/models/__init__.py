@@ -2,7 +2,6 @@ import os
 import torch
 
 from loguru import logger
-from transformers import AutoConfig
 from transformers.models.auto import modeling_auto
 from typing import Optional
 
@@ -15,6 +14,7 @@ from text_generation_server.models.galactica import Galactica, GalacticaSharded
 from text_generation_server.models.santacoder import SantaCoder
 from text_generation_server.models.gpt_neox import GPTNeoxSharded
 from text_generation_server.models.t5 import T5Sharded
+from text_generation_server.utils import load_config
 
 try:
     from text_generation_server.models.flash_neox import FlashNeoX, FlashNeoXSharded
@@ -48,9 +48,8 @@ if FLASH_ATTENTION:
     __all__.append(FlashNeoXSharded)
     __all__.append(FlashSantacoder)
 
-# The flag below controls whether to allow TF32 on matmul. This flag defaults to False
-# in PyTorch 1.12 and later.
-torch.backends.cuda.matmul.allow_tf32 = True
+# TF32 on matmul (False by default since PyTorch 1.12) is only enabled around the
+# transformers models forward, see `tf32_matmul`
 
 # The flag below controls whether to allow TF32 on cuDNN. This flag defaults to True.
 torch.backends.cudnn.allow_tf32 = True
@@ -58,6 +57,15 @@ torch.backends.cudnn.allow_tf32 = True
 # Disable gradients
 torch.set_grad_enabled(False)
 
+# model_type -> (sharded model class, non-sharded model class)
+MODEL_REGISTRY = {
+    "bloom": (BLOOMSharded, BLOOM),
+    "gpt_neox": (FlashNeoXSharded, FlashNeoX)
+    if FLASH_ATTENTION
+    else (GPTNeoxSharded, CausalLM),
+    "t5": (T5Sharded, Seq2SeqLM),
+}
+
 
 def get_model(
     model_id: str, revision: Optional[str], sharded: bool, quantize: bool
@@ -75,28 +83,15 @@ def get_model(
             santacoder_cls = FlashSantacoder if FLASH_ATTENTION else SantaCoder
             return santacoder_cls(model_id, revision, quantize)
 
-    config = AutoConfig.from_pretrained(model_id, revision=revision)
+    config = load_config(model_id, revision)
     model_type = config.model_type
 
-    if model_type == "bloom":
-        if sharded:
-            return BLOOMSharded(model_id, revision, quantize=quantize)
-        else:
-            return BLOOM(model_id, revision, quantize=quantize)
-
-    if model_type == "gpt_neox":
-        if sharded:
-            neox_cls = FlashNeoXSharded if FLASH_ATTENTION else GPTNeoxSharded
-            return neox_cls(model_id, revision, quantize=quantize)
-        else:
-            neox_cls = FlashNeoX if FLASH_ATTENTION else CausalLM
-            return neox_cls(model_id, revision, quantize=quantize)
-
-    if model_type == "t5":
+    if model_type in MODEL_REGISTRY:
+        sharded_cls, model_cls = MODEL_REGISTRY[model_type]
         if sharded:
-            return T5Sharded(model_id, revision, quantize=quantize)
+            return sharded_cls(model_id, revision, quantize=quantize, config=config)
         else:
-            return Seq2SeqLM(model_id, revision, quantize=quantize)
+            return model_cls(model_id, revision, quantize=quantize)
 
     if sharded:
         raise ValueError("sharded is not supported for AutoModel")
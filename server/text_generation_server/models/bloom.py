@@ -8,7 +8,7 @@ from safetensors import safe_open
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
-    AutoConfig,
+    PretrainedConfig,
     PreTrainedTokenizerBase,
 )
 from transformers.models.bloom.parallel_layers import (
@@ -22,6 +22,7 @@ from text_generation_server.models.causal_lm import CausalLMBatch
 from text_generation_server.pb import generate_pb2
 from text_generation_server.utils import (
     initialize_torch_distributed,
+    load_config,
     weight_files,
 )
 
@@ -56,7 +57,11 @@ class BLOOM(CausalLM):
 
 class BLOOMSharded(BLOOM):
     def __init__(
-        self, model_id: str, revision: Optional[str] = None, quantize: bool = False
+        self,
+        model_id: str,
+        revision: Optional[str] = None,
+        quantize: bool = False,
+        config: Optional[PretrainedConfig] = None,
     ):
         self.process_group, self.rank, self.world_size = initialize_torch_distributed()
         self.master = self.rank == 0
@@ -71,9 +76,9 @@ class BLOOMSharded(BLOOM):
             model_id, revision=revision, padding_side="left"
         )
 
-        config = AutoConfig.from_pretrained(
-            model_id, revision=revision, slow_but_exact=False, tp_parallel=True
-        )
+        if config is None:
+            config = load_config(model_id, revision)
+        config.slow_but_exact = False
         config.pad_token_id = 3
 
         torch.distributed.barrier(group=self.process_group)
@@ -35,6 +35,9 @@ import dropout_layer_norm
 
 from flash_attn.layers.rotary import RotaryEmbedding
 
+# FlashNeoX always runs in bfloat16 and therefore requires Ampere or newer GPUs
+FLASH_NEOX_DTYPE = torch.bfloat16
+
 
 class FastLayerNorm(nn.LayerNorm):
     def forward(self, hidden_states, residual=None):
@@ -150,6 +153,9 @@ class TensorParallelRowLinear(FastLinear):
 
 
 class TensorParallelEmbedding(nn.Embedding):
+    # Replaced by `add_null_idx`
+    post_load_replaced_parameters = ("weight",)
+
     def __init__(
         self,
         num_embeddings,
@@ -251,6 +257,9 @@ class PositionRotaryEmbedding(RotaryEmbedding):
 
 
 class FlashNeoxAttention(torch.nn.Module):
+    # Replaced by `shuffle_qkv_dims`
+    post_load_replaced_parameters = ("query_key_value.weight", "query_key_value.bias")
+
     def __init__(
         self,
         num_heads,
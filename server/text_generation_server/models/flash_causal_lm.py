@@ -1,9 +1,11 @@
+import os
 import torch
 import torch.distributed
 
 from torch.nn import functional as F
 
 from dataclasses import dataclass
+from loguru import logger
 from opentelemetry import trace
 from transformers import AutoTokenizer, PreTrainedTokenizerBase, PreTrainedModel
 from typing import Optional, Tuple, List, Type, Union
@@ -24,6 +26,11 @@ from text_generation_server.utils import (
 
 tracer = trace.get_tracer(__name__)
 
+# Opt-in: compile the model forward with torch.compile and warm it up at startup
+FLASH_COMPILE = int(os.environ.get("FLASH_COMPILE", 0)) == 1
+# Sequence lengths traced during the warmup
+WARMUP_BUCKETS = [1, 8, 32, 128, 512, 2048]
+
 
 @dataclass
 class FlashCausalLMBatch(Batch):
@@ -197,10 +204,14 @@ class FlashCausalLM(Model):
         model_id: str,
         revision: Optional[str] = None,
         quantize=False,
+        dtype: Optional[torch.dtype] = None,
     ):
         if torch.cuda.is_available():
             device = torch.device("cuda")
-            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            if dtype is None:
+                dtype = (
+                    torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+                )
         else:
             raise NotImplementedError("FlashCausalLM is only available on GPU")
 
@@ -224,6 +235,51 @@ class FlashCausalLM(Model):
             tokenizer=tokenizer,
             device=device,
         )
+        if FLASH_COMPILE:
+            self.compile_model()
+
+    def compile_model(self, fallback: bool = True):
+        """Compile the model forward and trace it on representative shapes
+
+        Falls back to the eager model if compilation or the warmup fails, unless
+        `fallback` is False
+        """
+        eager_model = self.model
+        try:
+            # Sequence lengths change at every step: trace with dynamic shapes
+            self.model = torch.compile(eager_model, dynamic=True)
+            max_seqlen = getattr(
+                eager_model.config, "max_position_embeddings", WARMUP_BUCKETS[-1]
+            )
+            for seqlen in WARMUP_BUCKETS:
+                # Keep room for the decode token
+                if seqlen >= max_seqlen:
+                    break
+                self.warmup(seqlen)
+        except Exception:
+            if not fallback:
+                raise
+            logger.exception("Could not compile the model, falling back to eager")
+            self.model = eager_model
+
+    def warmup(self, seqlen: int):
+        """Run one prefill and one decode forward on a single sequence of `seqlen` tokens"""
+        input_ids = torch.zeros(seqlen, dtype=torch.int64, device=self.device)
+        position_ids = torch.arange(seqlen, dtype=torch.int32, device=self.device)
+        cu_seqlens = torch.tensor([0, seqlen], dtype=torch.int32, device=self.device)
+
+        # Prefill
+        _, present = self.forward(input_ids, position_ids, cu_seqlens, seqlen)
+
+        # Decode
+        past = torch.nn.functional.pad(present, (0, 0, 0, 0, 0, 0, 0, 1))
+        self.forward(
+            input_ids[:1],
+            position_ids[-1:] + 1,
+            cu_seqlens + torch.tensor([0, 1], dtype=torch.int32, device=self.device),
+            seqlen + 1,
+            past,
+        )
 
     @property
     def batch_type(self) -> Type[FlashCausalLMBatch]:
@@ -251,6 +307,22 @@ class FlashCausalLM(Model):
             past_key_values=past_key_values,
         )
 
+    def forward_greedy(
+        self,
+        input_ids: torch.Tensor,
+        position_ids: torch.Tensor,
+        cu_seqlens: torch.Tensor,
+        max_s: int,
+        past_key_values: Optional = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Forward returning the argmax token ids and their logprobs instead of the logits"""
+        logits, present = self.forward(
+            input_ids, position_ids, cu_seqlens, max_s, past_key_values
+        )
+        next_token_logits, next_token_ids = logits.max(dim=-1)
+        next_token_logprobs = next_token_logits - torch.logsumexp(logits, dim=-1)
+        return next_token_ids, next_token_logprobs, present
+
     @tracer.start_as_current_span("generate_token")
     def generate_token(
         self, batch: FlashCausalLMBatch
@@ -259,14 +331,31 @@ class FlashCausalLM(Model):
         position_ids = batch.position_ids.to(self.device, non_blocking=True)
         cu_seqlens = batch.cu_seqlens.to(self.device)
 
-        out, present = self.forward(
-            batch.input_ids,
-            position_ids,
-            cu_seqlens,
-            batch.max_seqlen,
-            batch.past_key_values,
+        # Decode steps where every request is greedy do not need the full logits
+        greedy = batch.past_key_values is not None and all(
+            next_token_chooser.greedy
+            for next_token_chooser in batch.next_token_choosers
         )
 
+        if greedy:
+            next_token_ids, next_token_logprobs, present = self.forward_greedy(
+                batch.input_ids,
+                position_ids,
+                cu_seqlens,
+                batch.max_seqlen,
+                batch.past_key_values,
+            )
+            next_token_ids_list = next_token_ids.tolist()
+            next_token_logprobs = next_token_logprobs.tolist()
+        else:
+            out, present = self.forward(
+                batch.input_ids,
+                position_ids,
+                cu_seqlens,
+                batch.max_seqlen,
+                batch.past_key_values,
+            )
+
         # List of indices to cache
         next_batch_keep_indices = []
 
@@ -309,29 +398,36 @@ class FlashCausalLM(Model):
             start_index = cumulative_length
             end_index = cumulative_length + input_length
 
-            if batch.past_key_values is None:
-                # Prefill mode
-                # out is of shape [cumulative_sequence_lengths, vocab_size]
-                logits = out[start_index:end_index]
+            if greedy:
+                # Token already chosen by the model
+                next_token_id = next_token_ids[i].view(1, 1)
+                next_token_id_item = next_token_ids_list[i]
+                next_token_logprob = next_token_logprobs[i]
             else:
-                # Decode mode
-                # out is of shape [batch_size, vocab_size]
-                logits = out[i].unsqueeze(0)
+                if batch.past_key_values is None:
+                    # Prefill mode
+                    # out is of shape [cumulative_sequence_lengths, vocab_size]
+                    logits = out[start_index:end_index]
+                else:
+                    # Decode mode
+                    # out is of shape [batch_size, vocab_size]
+                    logits = out[i].unsqueeze(0)
 
-            # Select next token
-            next_token_id, logprobs = next_token_chooser(
-                all_input_ids_tensor[None, :input_length], logits
-            )
-            next_token_id_squeezed = next_token_id.squeeze()
-            next_token_id_item = next_token_id_squeezed.item()
+                # Select next token
+                next_token_id, logprobs = next_token_chooser(
+                    all_input_ids_tensor[None, :input_length], logits
+                )
+                next_token_id_squeezed = next_token_id.squeeze()
+                next_token_id_item = next_token_id_squeezed.item()
+
+                # Generated token
+                next_token_logprob = logprobs[-1, next_token_id_item]
 
             # Append next token to all tokens
             all_input_ids.append(next_token_id_item)
             all_input_ids_tensor[input_length] = next_token_id_item
             new_input_length = input_length + 1
 
-            # Generated token
-            next_token_logprob = logprobs[-1, next_token_id_item]
             next_token_text = self.decode_token(
                 next_token_id_item,
             )
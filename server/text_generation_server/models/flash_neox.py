@@ -1,14 +1,17 @@
+import concurrent
 import torch
 import torch.distributed
 
 from accelerate import init_empty_weights
+from concurrent.futures import ThreadPoolExecutor
 from opentelemetry import trace
-from safetensors import safe_open
-from transformers import AutoTokenizer, AutoConfig
-from typing import Optional, Tuple, List
+from transformers import AutoTokenizer, PretrainedConfig
+from typing import Optional, Tuple, List, Dict, Set
 
 from text_generation_server.models import FlashCausalLM
+from text_generation_server.models.flash_causal_lm import FLASH_COMPILE
 from text_generation_server.models.custom_modeling.flash_neox_modeling import (
+    FLASH_NEOX_DTYPE,
     FlashGPTNeoXForCausalLM,
     TensorParallelEmbedding,
     TensorParallelRowLinear,
@@ -16,28 +19,45 @@ from text_generation_server.models.custom_modeling.flash_neox_modeling import (
 )
 from text_generation_server.utils import (
     initialize_torch_distributed,
+    load_config,
+    unshard_logits,
     weight_files,
 )
+from text_generation_server.utils.weights import ShardAxis, load_file
 
 tracer = trace.get_tracer(__name__)
 
 
 class FlashNeoX(FlashCausalLM):
     def __init__(self, model_id: str, revision: Optional[str] = None, quantize=False):
+        if torch.cuda.is_available() and torch.cuda.get_device_capability()[0] < 8:
+            raise NotImplementedError("FlashNeoX requires an Ampere or newer GPU")
+
         super(FlashNeoX, self).__init__(
-            FlashGPTNeoXForCausalLM, model_id, revision, quantize
+            FlashGPTNeoXForCausalLM,
+            model_id,
+            revision,
+            quantize,
+            dtype=FLASH_NEOX_DTYPE,
         )
 
 
 class FlashNeoXSharded(FlashNeoX):
     def __init__(
-        self, model_id: str, revision: Optional[str] = None, quantize: bool = False
+        self,
+        model_id: str,
+        revision: Optional[str] = None,
+        quantize: bool = False,
+        config: Optional[PretrainedConfig] = None,
     ):
         self.process_group, self.rank, self.world_size = initialize_torch_distributed()
         self.master = self.rank == 0
+        self._gather_buffer = None
         if torch.cuda.is_available():
             device = torch.device(f"cuda:{self.rank}")
-            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            if torch.cuda.get_device_capability(device)[0] < 8:
+                raise NotImplementedError("FlashNeoX requires an Ampere or newer GPU")
+            dtype = FLASH_NEOX_DTYPE
         else:
             raise NotImplementedError("FlashNeoX is only available on GPU")
 
@@ -48,32 +68,35 @@ class FlashNeoXSharded(FlashNeoX):
             model_id, revision=revision, padding_side="left"
         )
 
-        config = AutoConfig.from_pretrained(
-            model_id, revision=revision, tp_parallel=True
-        )
+        if config is None:
+            config = load_config(model_id, revision)
 
-        torch.distributed.barrier(group=self.process_group)
         filenames = weight_files(model_id, revision=revision, extension=".safetensors")
 
         with init_empty_weights():
             model = FlashGPTNeoXForCausalLM(config)
 
-        torch.distributed.barrier(group=self.process_group)
+        # Loading is local to each rank: only synchronize once all ranks are done
         self.load_weights(
             model,
             filenames,
             quantize=quantize,
             device=device,
+            dtype=dtype,
             rank=self.rank,
             world_size=self.world_size,
         )
         model.post_load_weights()
-        self.model = model.eval().to(dtype)
         torch.distributed.barrier(group=self.process_group)
+        self.model = model.eval()
         super(FlashCausalLM, self).__init__(
             tokenizer=tokenizer,
             device=device,
         )
+        if FLASH_COMPILE:
+            # The warmup forwards run collectives: a rank falling back to eager on
+            # its own would leave its peers blocked in them. Fail the shard instead.
+            self.compile_model(fallback=False)
 
     @staticmethod
     def load_weights(
@@ -81,72 +104,95 @@ class FlashNeoXSharded(FlashNeoX):
         filenames: List[str],
         quantize: bool,
         device: torch.device,
+        dtype: torch.dtype,
         rank: int,
         world_size: int,
     ):
+        if quantize:
+            raise NotImplementedError("FlashNeoX does not support quantization")
+
+        modules = dict(model.named_modules())
         parameters = dict(model.named_parameters())
-        for file in filenames:
-            with safe_open(
-                file, framework="pt", device=str(device) if not quantize else "cpu"
-            ) as f:
-                for name in f.keys():
-                    module_name, param_name = name.rsplit(".", 1)
-                    module = model.get_submodule(module_name)
-
-                    current_parameter_tensor = parameters.get(name, None)
-
-                    slice_ = f.get_slice(name)
-
-                    if isinstance(module, TensorParallelColumnLinear):
-                        size = slice_.get_shape()[0]
-                        block_size = size // world_size
-                        start = rank * block_size
-                        stop = (rank + 1) * block_size
-                        tensor = slice_[start:stop]
-                    elif isinstance(module, TensorParallelRowLinear):
-                        if param_name == "weight":
-                            size = slice_.get_shape()[1]
-                            block_size = size // world_size
-                            start = rank * block_size
-                            stop = (rank + 1) * block_size
-                            tensor = slice_[:, start:stop]
-                        else:
-                            tensor = slice_[:]
-                            # XXX: Hack for Rowlinear to add the bias only once.
-                            if rank != 0:
-                                tensor = torch.zeros_like(tensor)
-                    elif isinstance(module, TensorParallelEmbedding):
-                        size = slice_.get_shape()[0]
-                        block_size = size // world_size
-                        start = rank * block_size
-                        stop = (rank + 1) * block_size
-                        tensor = slice_[start:stop]
-                    elif name == "embed_out.weight" and model.gpt_neox.tp_embeddings:
-                        size = slice_.get_shape()[0]
-                        block_size = size // world_size
-                        start = rank * block_size
-                        stop = (rank + 1) * block_size
-                        tensor = slice_[start:stop]
-                    else:
-                        try:
-                            tensor = slice_[:]
-                        except:
-                            tensor = f.get_tensor(name)
-
-                    if (
-                        current_parameter_tensor is not None
-                        and current_parameter_tensor.shape != tensor.shape
-                    ):
-                        raise ValueError(
-                            f"Name {name} -- Current {current_parameter_tensor.shape} and got {tensor.shape}"
-                        )
-
-                    tensor = tensor.contiguous()
-
-                    if current_parameter_tensor is not None:
-                        module._parameters[param_name] = tensor
+        plan = FlashNeoXSharded.shard_plan(model)
+        standalone = FlashNeoXSharded.post_load_replaced_parameters(model)
+
+        # Files are independent: overlap the safetensors reads of one file with the
+        # host to device copies of another
+        executor = ThreadPoolExecutor(max_workers=4)
+        futures = [
+            executor.submit(
+                load_file,
+                modules,
+                parameters,
+                plan,
+                standalone,
+                file,
+                device=device,
+                target_dtype=dtype,
+                rank=rank,
+                world_size=world_size,
+            )
+            for file in filenames
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            # Re-raise exceptions from the worker threads
+            future.result()
+        executor.shutdown()
+
+        # The pinned staging buffers go back to the caching host allocator, which
+        # would keep them page-locked for the life of the server: release them once
+        # the copies are done
+        torch.cuda.synchronize(device)
+        if hasattr(torch._C, "_host_emptyCache"):
+            torch._C._host_emptyCache()
+
+    @staticmethod
+    def post_load_replaced_parameters(model) -> Set[str]:
+        """Parameters that `post_load_weights` replaces with new tensors"""
+        names = set()
+        for module_name, module in model.named_modules():
+            for param_name in getattr(module, "post_load_replaced_parameters", ()):
+                names.add(f"{module_name}.{param_name}")
+        return names
+
+    @staticmethod
+    def shard_plan(model) -> Dict[str, ShardAxis]:
+        """Classify every parameter once instead of once per loaded tensor"""
+        plan = {}
+        for module_name, module in model.named_modules():
+            for param_name, _ in module.named_parameters(recurse=False):
+                name = f"{module_name}.{param_name}"
+                if isinstance(module, TensorParallelColumnLinear):
+                    plan[name] = ShardAxis.COLUMN
+                elif isinstance(module, TensorParallelRowLinear):
+                    if param_name == "weight":
+                        plan[name] = ShardAxis.ROW
                     else:
-                        module._buffers[param_name] = tensor
+                        plan[name] = ShardAxis.ZERO_IF_NONZERO_RANK
+                elif isinstance(module, TensorParallelEmbedding):
+                    plan[name] = ShardAxis.EMBEDDING
+                elif name == "embed_out.weight" and model.gpt_neox.tp_embeddings:
+                    plan[name] = ShardAxis.EMBEDDING
+                else:
+                    plan[name] = ShardAxis.REPLICATE
+        return plan
+
+    def gather_buffer(self, logits: torch.Tensor, decode: bool) -> torch.Tensor:
+        """Output buffer of the logits all gather
+
+        Only decode buffers (one row per request) are reused across forwards: a
+        cached prefill buffer would hold the logits of the largest prefill forever
+        """
+        numel = self.world_size * logits.numel()
+        if not decode:
+            return logits.new_empty(numel).view(-1, logits.shape[1])
+        if (
+            self._gather_buffer is None
+            or self._gather_buffer.numel() < numel
+            or self._gather_buffer.dtype != logits.dtype
+        ):
+            self._gather_buffer = logits.new_empty(numel)
+        return self._gather_buffer[:numel].view(-1, logits.shape[1])
 
     def forward(
         self,
@@ -166,9 +212,14 @@ class FlashNeoXSharded(FlashNeoX):
             )
 
             # Logits are sharded, so we need to gather them
-            world_logits = [torch.empty_like(logits) for _ in range(self.world_size)]
-            torch.distributed.all_gather(world_logits, logits, group=self.process_group)
-            world_logits = torch.cat(world_logits, dim=1)
+            # all_gather_into_tensor stacks the shards along dim 0 in a single NCCL call
+            world_logits = self.gather_buffer(
+                logits, decode=past_key_values is not None
+            )
+            torch.distributed.all_gather_into_tensor(
+                world_logits, logits.contiguous(), group=self.process_group
+            )
+            world_logits = unshard_logits(world_logits, self.world_size)
 
             return world_logits, present
         # While the model itself is sharded, the embeddings might not as they might not be dividable by num-shard
@@ -176,3 +227,48 @@ class FlashNeoXSharded(FlashNeoX):
             return super(FlashNeoXSharded, self).forward(
                 input_ids, position_ids, cu_seqlens, max_s, past_key_values
             )
+
+    def forward_greedy(
+        self,
+        input_ids: torch.Tensor,
+        position_ids: torch.Tensor,
+        cu_seqlens: torch.Tensor,
+        max_s: int,
+        past_key_values: Optional = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        if not self.model.gpt_neox.tp_embeddings:
+            return super(FlashNeoXSharded, self).forward_greedy(
+                input_ids, position_ids, cu_seqlens, max_s, past_key_values
+            )
+
+        logits, present = self.model.forward(
+            input_ids=input_ids,
+            position_ids=position_ids,
+            cu_seqlens=cu_seqlens,
+            max_s=max_s,
+            past_key_values=past_key_values,
+        )
+
+        # Logits are sharded: reduce the argmax and the softmax denominator across
+        # ranks instead of gathering the full vocabulary
+        local_max, local_ids = logits.max(dim=-1)
+        local_ids += self.rank * logits.shape[1]
+
+        world_max = local_max.new_empty(self.world_size, local_max.shape[0])
+        world_ids = local_ids.new_empty(self.world_size, local_ids.shape[0])
+        torch.distributed.all_gather_into_tensor(
+            world_max, local_max, group=self.process_group
+        )
+        torch.distributed.all_gather_into_tensor(
+            world_ids, local_ids, group=self.process_group
+        )
+        max_logits, owner = world_max.max(dim=0)
+        next_token_ids = world_ids.gather(0, owner.unsqueeze(0)).squeeze(0)
+
+        # Online softmax: every shard sums its exponentials against the global max
+        sum_exp = torch.exp(logits.float() - max_logits.float().unsqueeze(-1)).sum(-1)
+        torch.distributed.all_reduce(sum_exp, group=self.process_group)
+        # The chosen token is the max logit, so its logprob is -log(sum_exp)
+        next_token_logprobs = -torch.log(sum_exp)
+
+        return next_token_ids, next_token_logprobs, present
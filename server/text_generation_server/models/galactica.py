@@ -9,7 +9,7 @@ from safetensors import safe_open
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
-    AutoConfig,
+    PretrainedConfig,
     PreTrainedTokenizerBase,
 )
 from transformers.models.opt.parallel_layers import (
@@ -25,6 +25,7 @@ from text_generation_server.utils import (
     NextTokenChooser,
     StoppingCriteria,
     initialize_torch_distributed,
+    load_config,
     weight_files,
 )
 
@@ -176,7 +177,11 @@ class Galactica(CausalLM):
 
 class GalacticaSharded(Galactica):
     def __init__(
-        self, model_id: str, revision: Optional[str] = None, quantize: bool = False
+        self,
+        model_id: str,
+        revision: Optional[str] = None,
+        quantize: bool = False,
+        config: Optional[PretrainedConfig] = None,
     ):
         self.process_group, self.rank, self.world_size = initialize_torch_distributed()
         self.master = self.rank == 0
@@ -191,9 +196,8 @@ class GalacticaSharded(Galactica):
             model_id, revision=revision, padding_side="left"
         )
 
-        config = AutoConfig.from_pretrained(
-            model_id, revision=revision, tp_parallel=True
-        )
+        if config is None:
+            config = load_config(model_id, revision)
         tokenizer.pad_token_id = config.pad_token_id
 
         torch.distributed.barrier(group=self.process_group)
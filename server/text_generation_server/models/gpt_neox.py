@@ -8,7 +8,7 @@ from safetensors import safe_open
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
-    AutoConfig,
+    PretrainedConfig,
 )
 from transformers.models.gpt_neox.parallel_layers import (
     TensorParallelColumnLinear,
@@ -19,6 +19,7 @@ from transformers.models.gpt_neox.parallel_layers import (
 from text_generation_server.models import CausalLM
 from text_generation_server.utils import (
     initialize_torch_distributed,
+    load_config,
     weight_files,
 )
 
@@ -32,7 +33,11 @@ except Exception as e:
 
 class GPTNeoxSharded(CausalLM):
     def __init__(
-        self, model_id: str, revision: Optional[str] = None, quantize: bool = False
+        self,
+        model_id: str,
+        revision: Optional[str] = None,
+        quantize: bool = False,
+        config: Optional[PretrainedConfig] = None,
     ):
         self.process_group, self.rank, self.world_size = initialize_torch_distributed()
         self.master = self.rank == 0
@@ -48,9 +53,8 @@ class GPTNeoxSharded(CausalLM):
         )
         tokenizer.pad_token = tokenizer.eos_token
 
-        config = AutoConfig.from_pretrained(
-            model_id, revision=revision, tp_parallel=True
-        )
+        if config is None:
+            config = load_config(model_id, revision)
 
         torch.distributed.barrier(group=self.process_group)
         filenames = weight_files(model_id, revision=revision, extension=".safetensors")
@@ -13,7 +13,12 @@ from text_generation_server.models.types import (
     PrefillTokens,
 )
 from text_generation_server.pb import generate_pb2
-from text_generation_server.utils import NextTokenChooser, StoppingCriteria, Sampling
+from text_generation_server.utils import (
+    NextTokenChooser,
+    StoppingCriteria,
+    Sampling,
+    tf32_matmul,
+)
 
 tracer = trace.get_tracer(__name__)
 
@@ -404,14 +409,15 @@ class Seq2SeqLM(Model):
         else:
             encoder_last_hidden_state = batch.encoder_last_hidden_state
 
-        logits, encoder_last_hidden_state, past = self.forward(
-            batch.input_ids,
-            batch.attention_mask,
-            decoder_input_ids,
-            decoder_attention_mask,
-            encoder_last_hidden_state,
-            batch.past_key_values,
-        )
+        with tf32_matmul():
+            logits, encoder_last_hidden_state, past = self.forward(
+                batch.input_ids,
+                batch.attention_mask,
+                decoder_input_ids,
+                decoder_attention_mask,
+                encoder_last_hidden_state,
+                batch.past_key_values,
+            )
 
         # List of indices to cache
         next_batch_keep_indices = []
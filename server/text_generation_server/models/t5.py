@@ -8,7 +8,7 @@ from safetensors import safe_open
 from transformers import (
     AutoTokenizer,
     AutoModelForSeq2SeqLM,
-    AutoConfig,
+    PretrainedConfig,
 )
 from transformers.models.t5.parallel_layers import (
     TensorParallelColumnLinear,
@@ -19,6 +19,7 @@ from transformers.models.t5.parallel_layers import (
 from text_generation_server.models import Seq2SeqLM
 from text_generation_server.utils import (
     initialize_torch_distributed,
+    load_config,
     weight_files,
 )
 
@@ -32,7 +33,11 @@ except Exception as e:
 
 class T5Sharded(Seq2SeqLM):
     def __init__(
-        self, model_id: str, revision: Optional[str] = None, quantize: bool = False
+        self,
+        model_id: str,
+        revision: Optional[str] = None,
+        quantize: bool = False,
+        config: Optional[PretrainedConfig] = None,
     ):
         self.process_group, self.rank, self.world_size = initialize_torch_distributed()
         self.master = self.rank == 0
@@ -47,9 +52,8 @@ class T5Sharded(Seq2SeqLM):
             model_id, revision=revision, padding_side="left"
         )
 
-        config = AutoConfig.from_pretrained(
-            model_id, revision=revision, tp_parallel=True
-        )
+        if config is None:
+            config = load_config(model_id, revision)
         tokenizer.bos_token_id = config.decoder_start_token_id
 
         torch.distributed.barrier(group=self.process_group)
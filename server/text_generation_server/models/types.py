@@ -35,8 +35,11 @@ class Batch(ABC):
         raise NotImplementedError
 
 
+# `__slots__` is declared by hand as `dataclass(slots=True)` needs Python 3.10
 @dataclass
 class GeneratedText:
+    __slots__ = ("text", "generated_tokens", "finish_reason", "seed")
+
     text: str
     generated_tokens: int
     finish_reason: FinishReason
@@ -53,6 +56,8 @@ class GeneratedText:
 
 @dataclass
 class PrefillTokens:
+    __slots__ = ("token_ids", "logprobs", "texts")
+
     token_ids: List[int]
     logprobs: List[float]
     texts: List[str]
@@ -68,6 +73,16 @@ class PrefillTokens:
 
 @dataclass
 class Generation:
+    __slots__ = (
+        "request_id",
+        "prefill_tokens",
+        "token_id",
+        "token_logprob",
+        "token_text",
+        "token_is_special",
+        "generated_text",
+    )
+
     request_id: int
     prefill_tokens: Optional[PrefillTokens]
     token_id: int
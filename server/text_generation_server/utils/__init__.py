@@ -1,6 +1,11 @@
 from text_generation_server.utils.convert import convert_file, convert_files
-from text_generation_server.utils.dist import initialize_torch_distributed
+from text_generation_server.utils.dist import (
+    initialize_torch_distributed,
+    unshard_logits,
+)
+from text_generation_server.utils.precision import tf32_matmul
 from text_generation_server.utils.hub import (
+    load_config,
     weight_files,
     weight_hub_files,
     download_weights,
@@ -21,6 +26,9 @@ __all__ = [
     "convert_file",
     "convert_files",
     "initialize_torch_distributed",
+    "unshard_logits",
+    "tf32_matmul",
+    "load_config",
     "weight_files",
     "weight_hub_files",
     "download_weights",
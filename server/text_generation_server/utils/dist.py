@@ -33,3 +33,15 @@ def initialize_torch_distributed():
     )
 
     return torch.distributed.group.WORLD, rank, world_size
+
+
+def unshard_logits(gathered: torch.Tensor, world_size: int) -> torch.Tensor:
+    """[world_size * tokens, vocab_shard] -> [tokens, world_size * vocab_shard]"""
+    tokens = gathered.shape[0] // world_size
+    vocab_shard = gathered.shape[1]
+
+    return (
+        gathered.view(world_size, tokens, vocab_shard)
+        .permute(1, 0, 2)
+        .reshape(tokens, -1)
+    )
@@ -1,7 +1,9 @@
+import copy
 import time
 import os
 
 from datetime import timedelta
+from functools import lru_cache
 from loguru import logger
 from pathlib import Path
 from typing import Optional, List
@@ -13,10 +15,25 @@ from huggingface_hub.utils import (
     EntryNotFoundError,
     RevisionNotFoundError,  # Import here to ease try/except in other part of the lib
 )
+from transformers import AutoConfig, PretrainedConfig
 
 WEIGHTS_CACHE_OVERRIDE = os.getenv("WEIGHTS_CACHE_OVERRIDE", None)
 
 
+@lru_cache(maxsize=4)
+def _load_config(model_id: str, revision: Optional[str] = None) -> PretrainedConfig:
+    return AutoConfig.from_pretrained(model_id, revision=revision, tp_parallel=True)
+
+
+def load_config(model_id: str, revision: Optional[str] = None) -> PretrainedConfig:
+    """Load the tensor parallel config of a model
+
+    Cached so that `get_model` and the model it instantiates share one lookup.
+    Returns a copy: models set their own attributes on the config.
+    """
+    return copy.deepcopy(_load_config(model_id, revision))
+
+
 def weight_hub_files(
     model_id: str, revision: Optional[str] = None, extension: str = ".safetensors"
 ) -> List[str]:
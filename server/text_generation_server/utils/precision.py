@@ -0,0 +1,14 @@
+import torch
+
+from contextlib import contextmanager
+
+
+@contextmanager
+def tf32_matmul():
+    """Allow TF32 for the float32 matmuls run in this scope only"""
+    allow_tf32 = torch.backends.cuda.matmul.allow_tf32
+    torch.backends.cuda.matmul.allow_tf32 = True
+    try:
+        yield
+    finally:
+        torch.backends.cuda.matmul.allow_tf32 = allow_tf32
@@ -72,6 +72,8 @@ class NextTokenChooser:
 
         self.warpers = warpers
         self.choice = Sampling(seed, device) if sampling else Greedy()
+        # Plain argmax over the raw logits: the model can choose the token itself
+        self.greedy = not sampling and not warpers
 
     def __call__(self, input_ids, scores):
         # Warp logits
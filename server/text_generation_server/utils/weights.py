@@ -0,0 +1,264 @@
+import itertools
+import json
+import math
+import struct
+import torch
+
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+from safetensors import safe_open
+from typing import Tuple, List, Dict, Set
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+# Byte alignment of the tensors packed in the flat per-file load buffers
+BUFFER_ALIGNMENT = 256
+
+
+def align(nbytes: int, alignment: int = BUFFER_ALIGNMENT) -> int:
+    return (nbytes + alignment - 1) // alignment * alignment
+
+
+class ShardAxis(Enum):
+    """How a checkpoint tensor is split across tensor parallel ranks"""
+
+    # Split along dim 0 (TensorParallelColumnLinear weight and bias)
+    COLUMN = 0
+    # Split along dim 1 (TensorParallelRowLinear weight)
+    ROW = 1
+    # Split along dim 0 (TensorParallelEmbedding and sharded lm head)
+    EMBEDDING = 2
+    # Full tensor on every rank
+    REPLICATE = 3
+    # Full tensor on rank 0, zeros on other ranks (TensorParallelRowLinear bias)
+    ZERO_IF_NONZERO_RANK = 4
+
+
+def sharded_shape(shape: List[int], axis: ShardAxis, world_size: int) -> List[int]:
+    """Shape of the part of a tensor of shape `shape` owned by one rank"""
+    shape = list(shape)
+    if axis == ShardAxis.COLUMN or axis == ShardAxis.EMBEDDING:
+        shape[0] //= world_size
+    elif axis == ShardAxis.ROW:
+        shape[1] //= world_size
+    return shape
+
+
+@lru_cache(maxsize=None)
+def element_size(dtype: torch.dtype) -> int:
+    """Size in bytes of one element of `dtype`"""
+    return torch.empty((), dtype=dtype).element_size()
+
+
+@lru_cache(maxsize=None)
+def shard_bounds(size: int, rank: int, world_size: int) -> Tuple[int, int]:
+    """Bounds of the block of a dimension of size `size` owned by `rank`
+
+    Cached as checkpoints only contain a handful of distinct dimension sizes
+    """
+    block_size = size // world_size
+    start = rank * block_size
+    stop = (rank + 1) * block_size
+    return start, stop
+
+
+def shard_tensor(
+    f, name: str, shape: List[int], axis: ShardAxis, rank: int, world_size: int
+):
+    """Read the part of tensor `name` owned by `rank`"""
+    slice_ = f.get_slice(name)
+
+    if axis == ShardAxis.COLUMN or axis == ShardAxis.EMBEDDING:
+        start, stop = shard_bounds(shape[0], rank, world_size)
+        return slice_[start:stop]
+    elif axis == ShardAxis.ROW:
+        start, stop = shard_bounds(shape[1], rank, world_size)
+        return slice_[:, start:stop]
+    elif axis == ShardAxis.ZERO_IF_NONZERO_RANK:
+        # Only rank 0 reads the tensor, the other ranks use zeros
+        assert rank == 0
+        return slice_[:]
+    else:
+        try:
+            return slice_[:]
+        except:
+            return f.get_tensor(name)
+
+
+@dataclass
+class TensorLayout:
+    """Where the local shard of a checkpoint tensor lives in the flat file buffer"""
+
+    name: str
+    module: torch.nn.Module
+    param_name: str
+    is_parameter: bool
+    axis: ShardAxis
+    # Full shape in the checkpoint
+    shape: List[int]
+    dtype: torch.dtype
+    # Shape of the shard owned by this rank
+    local_shape: torch.Size
+    # Byte offset in the flat buffer
+    offset: int
+    # Gets its own device allocation instead of a view of the flat device buffer
+    standalone: bool
+
+    @property
+    def nbytes(self) -> int:
+        return math.prod(self.local_shape) * element_size(self.dtype)
+
+
+def flat_view(buffer: torch.Tensor, layout: TensorLayout) -> torch.Tensor:
+    """View a region of a flat uint8 buffer as a contiguous tensor"""
+    return (
+        buffer[layout.offset : layout.offset + layout.nbytes]
+        .view(layout.dtype)
+        .view(layout.local_shape)
+    )
+
+
+def read_header(file: str) -> Dict[str, Dict]:
+    """Read the safetensors JSON header: {name: {dtype, shape, data_offsets}}"""
+    with open(file, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    return header
+
+
+def load_file(
+    modules: Dict[str, torch.nn.Module],
+    parameters: Dict[str, torch.nn.Parameter],
+    plan: Dict[str, ShardAxis],
+    standalone: Set[str],
+    file: str,
+    device: torch.device,
+    target_dtype: torch.dtype,
+    rank: int,
+    world_size: int,
+):
+    """Load the shards owned by `rank` of the tensors of `file` into `modules`
+
+    Tensors are views of one flat device buffer per file, except the `standalone`
+    ones which get their own allocation so that they can be freed when replaced
+    """
+    # Metadata only pass: sharded shapes and dtypes are known before reading
+    # anything, in on-disk order to keep the reads sequential
+    header = read_header(file)
+    names = sorted(header, key=lambda name: header[name]["data_offsets"][0])
+
+    tensors = []
+    shared_bytes = 0
+    standalone_bytes = 0
+    for name in names:
+        module_name, param_name = name.rsplit(".", 1)
+        module = modules[module_name]
+
+        current_parameter_tensor = parameters.get(name, None)
+
+        axis = plan.get(name, ShardAxis.REPLICATE)
+        shape = header[name]["shape"]
+        dtype = SAFETENSORS_DTYPES[header[name]["dtype"]]
+        # Cast while staging (like `Module.to`, only floating point tensors) so
+        # that only the target dtype reaches the device
+        if dtype.is_floating_point:
+            dtype = target_dtype
+        local_shape = torch.Size(sharded_shape(shape, axis, world_size))
+
+        if (
+            current_parameter_tensor is not None
+            and current_parameter_tensor.shape != local_shape
+        ):
+            raise ValueError(
+                f"Name {name} -- Current {current_parameter_tensor.shape} and got {local_shape}"
+            )
+
+        layout = TensorLayout(
+            name=name,
+            module=module,
+            param_name=param_name,
+            is_parameter=current_parameter_tensor is not None,
+            axis=axis,
+            shape=shape,
+            dtype=dtype,
+            local_shape=local_shape,
+            offset=0,
+            standalone=name in standalone,
+        )
+        tensors.append(layout)
+        # Standalone tensors are staged after the shared ones, see below
+        if layout.standalone:
+            layout.offset = standalone_bytes
+            standalone_bytes += align(layout.nbytes)
+        else:
+            layout.offset = shared_bytes
+            shared_bytes += align(layout.nbytes)
+
+    for layout in tensors:
+        if layout.standalone:
+            layout.offset += shared_bytes
+
+    # Stage the whole file in one pinned buffer and issue a single host to device
+    # copy instead of one allocation and one copy per tensor. Only the standalone
+    # tensors get their own allocation and copy.
+    # `copy_` casts the checkpoint tensors to the staging dtype.
+    pinned_buffer = torch.empty(
+        shared_bytes + standalone_bytes, dtype=torch.uint8, pin_memory=True
+    )
+    # Open on CPU to use the mmap and make the host to device copy explicit
+    with safe_open(file, framework="pt", device="cpu") as f:
+        for layout in tensors:
+            staged = flat_view(pinned_buffer, layout)
+            # XXX: Hack for Rowlinear to add the bias only once.
+            # Other ranks get zeros: no need to read it
+            if layout.axis == ShardAxis.ZERO_IF_NONZERO_RANK and rank != 0:
+                staged.zero_()
+                continue
+
+            tensor = shard_tensor(
+                f, layout.name, layout.shape, layout.axis, rank, world_size
+            )
+            # `copy_` would silently broadcast a wrongly sliced tensor
+            assert (
+                tensor.shape == layout.local_shape
+            ), f"Name {layout.name} -- Expected {layout.local_shape} and read {tensor.shape}"
+            staged.copy_(tensor)
+
+    # Copy on a side stream so the transfer overlaps with the disk reads and
+    # copies of the other files
+    copy_stream = torch.cuda.Stream(device)
+    with torch.cuda.stream(copy_stream):
+        device_buffer = pinned_buffer[:shared_bytes].to(device, non_blocking=True)
+        standalone_tensors = {
+            layout.name: flat_view(pinned_buffer, layout).to(device, non_blocking=True)
+            for layout in tensors
+            if layout.standalone
+        }
+    # The weights are used on the default stream: order it after the copy
+    default_stream = torch.cuda.default_stream(device)
+    default_stream.wait_stream(copy_stream)
+    for tensor in itertools.chain([device_buffer], standalone_tensors.values()):
+        tensor.record_stream(default_stream)
+
+    for layout in tensors:
+        if layout.standalone:
+            tensor = standalone_tensors[layout.name]
+        else:
+            tensor = flat_view(device_buffer, layout)
+        if layout.is_parameter:
+            layout.module._parameters[layout.param_name] = tensor
+        else:
+            layout.module._buffers[layout.param_name] = tensor